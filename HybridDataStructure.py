@@ -1,67 +1,160 @@
+import os
+import sys
 import threading
 import time
 import random
 
+class ThreadStats:
+    __slots__ = ("counter", "reads", "writes")
+
+    def __init__(self):
+        self.counter = 0
+        self.reads = 0
+        self.writes = 0
+
+class ShardedRWLock:
+    # Readers take only the slot picked by their thread id; writers take
+    # every slot in order, so concurrent readers rarely touch the same lock.
+    def __init__(self, num_slots=None):
+        self._locks = [threading.Lock() for _ in range(num_slots or os.cpu_count() or 1)]
+        self._num_slots = len(self._locks)
+
+    def read(self):
+        return self._locks[threading.get_native_id() % self._num_slots]
+
+    def write(self):
+        return self
+
+    def __enter__(self):
+        for lock in self._locks:
+            lock.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        for lock in reversed(self._locks):
+            lock.release()
+
+# CPython's GIL makes a single dict.get atomic, so readers can skip the
+# shard lock. Free-threaded builds report the GIL as disabled and take the
+# shard's read side instead.
+GIL_ENABLED = getattr(sys, "_is_gil_enabled", lambda: True)()
+
+class Shard:
+    # A shard's lock and dict live on one object, so the hot path fetches
+    # both with a single index instead of two parallel-list lookups.
+    __slots__ = ("lock", "write_lock", "data")
+
+    def __init__(self):
+        if GIL_ENABLED:
+            # Readers never lock on GIL builds, so writers only need one
+            # plain mutex rather than every slot of a ShardedRWLock.
+            self.lock = self.write_lock = threading.Lock()
+        else:
+            self.lock = ShardedRWLock()
+            self.write_lock = self.lock.write()
+        self.data = {}
+
 class HybridDataStructure:
-    def __init__(self, num_shards=4):
+    def __init__(self, num_shards=8):
+        # A power-of-two shard count lets keys be routed with a bit mask.
+        if num_shards <= 0 or num_shards & (num_shards - 1):
+            raise ValueError(f"num_shards must be a power of two, got {num_shards}")
         self.num_shards = num_shards
-        self.local_locks = [threading.Lock() for _ in range(num_shards)]
-        self.local_data = [{} for _ in range(num_shards)]
-        self.global_lock = threading.Lock()
-        self.global_counter = 0
-        self.local_reads = 0
-        self.local_writes = 0
-    
-    def _get_shard_index(self, key):
-        return hash(key) % self.num_shards
+        self._mask = num_shards - 1
+        self.shards = [Shard() for _ in range(num_shards)]
+        # Lock-free counters: every thread updates its own ThreadStats and
+        # the totals are summed on read, so hot-path updates never contend.
+        self._tls = threading.local()
+        self._tls_list = []
+        self._registry_lock = threading.Lock()
     
+    def _thread_stats(self):
+        try:
+            return self._tls.stats
+        except AttributeError:
+            stats = ThreadStats()
+            with self._registry_lock:
+                self._tls_list.append(stats)
+            self._tls.stats = stats
+            return stats
+
+    def _sum_stats(self, field):
+        with self._registry_lock:
+            stats_list = list(self._tls_list)
+        return sum(getattr(stats, field) for stats in stats_list)
+
+    @property
+    def local_data(self):
+        return [shard.data for shard in self.shards]
+
+    @property
+    def global_counter(self):
+        # Not a linearizable read: cells are summed one at a time, so the
+        # total is only exact once every updating thread has stopped.
+        return self._sum_stats("counter")
+
+    @property
+    def local_reads(self):
+        return self._sum_stats("reads")
+
+    @property
+    def local_writes(self):
+        return self._sum_stats("writes")
+
+    def _locked_add(self, key, value, counter_add):
+        # Shared by local_write and hybrid_operation; the counter cell is
+        # thread-private, so it is updated after the shard lock is released.
+        shard = self.shards[hash(key) & self._mask]
+        data = shard.data
+        with shard.write_lock:
+            data[key] = data.get(key, 0) + value
+        stats = self._thread_stats()
+        stats.counter += counter_add
+        stats.writes += 1
+
     def local_write(self, key, value):
-        shard_index = self._get_shard_index(key)
-        with self.local_locks[shard_index]:
-            if key in self.local_data[shard_index]:
-                self.local_data[shard_index][key] += value
-            else:
-                self.local_data[shard_index][key] = value
-            self.local_writes += 1
+        self._locked_add(key, value, 0)
     
     def local_read(self, key):
-        shard_index = self._get_shard_index(key)
-        with self.local_locks[shard_index]:
-            self.local_reads += 1
-            return self.local_data[shard_index].get(key, None)
+        shard = self.shards[hash(key) & self._mask]
+        self._thread_stats().reads += 1
+        if GIL_ENABLED:
+            return shard.data.get(key, None)
+        with shard.lock.read():
+            return shard.data.get(key, None)
     
     def critical_update(self, increment=1):
-        with self.global_lock:
-            self.global_counter += increment
+        self._thread_stats().counter += increment
     
     def hybrid_operation(self, key, value):
-        self.local_write(key, value)
-        self.critical_update(increment=value)
+        # One shard-lock acquisition covers the local write; the global
+        # counter add rides on the same ThreadStats lookup.
+        self._locked_add(key, value, value)
     
     def print_stats(self):
         print(f"Total Reads: {self.local_reads}, Total Writes: {self.local_writes}")
 
+# Operations run back to back so run_test times the data structure itself.
+OPS_PER_THREAD = 1000
+
 def demo_local_operations(hybrid_obj, thread_id):
-    for _ in range(5):
-        key = f"user_{random.randint(1, 3)}"
+    for _ in range(OPS_PER_THREAD):
+        key = random.randint(1, 3)
         if random.random() < 0.5:
             val = random.randint(100, 999)
             hybrid_obj.local_write(key, val)
         else:
             hybrid_obj.local_read(key)
-        time.sleep(random.random() * 0.1)
 
 def demo_critical_operation(hybrid_obj, thread_id):
-    for _ in range(5):
+    for _ in range(OPS_PER_THREAD):
         hybrid_obj.critical_update(increment=1)
-        time.sleep(random.random() * 0.1)
 
 def demo_hybrid_operation(hybrid_obj, thread_id):
-    for _ in range(5):
-        key = f"resource_{thread_id}"
+    for _ in range(OPS_PER_THREAD):
+        key = 100 + thread_id  # kept clear of demo_local_operations' keys 1-3
         val = random.randint(1000, 2000)
         hybrid_obj.hybrid_operation(key, val)
-        time.sleep(random.random() * 0.1)
 
 def run_test(num_threads, hybrid_obj):
     threads = []
@@ -90,11 +183,12 @@ def run_test(num_threads, hybrid_obj):
         t.join()
     end_time = time.time()
     
+    global_counter = hybrid_obj.global_counter
     total_local_sum = sum(sum(shard.values()) for shard in hybrid_obj.local_data)
-    difference = hybrid_obj.global_counter - total_local_sum
+    difference = global_counter - total_local_sum
     
     print(f"Test with {num_threads} threads completed in {end_time - start_time:.4f} seconds")
-    print(f"Final Global Counter = {hybrid_obj.global_counter}")
+    print(f"Final Global Counter = {global_counter}")
     print(f"Total Local Sum = {total_local_sum}")
     print(f"Difference = {difference}")
     print("Final Local Data:")
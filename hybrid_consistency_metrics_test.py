@@ -1,96 +1,222 @@
+import os
+import sys
 import threading
 import time
-import random
 import queue
+import numpy as np
 import matplotlib.pyplot as plt
 
+class ThreadStats:
+    __slots__ = ("counter", "reads", "writes", "lock_wait_time", "lock_samples", "write_conflicts")
+
+    def __init__(self):
+        self.counter = 0
+        self.reads = 0
+        self.writes = 0
+        self.lock_wait_time = 0
+        self.lock_samples = 0
+        self.write_conflicts = 0
+
+class ShardedRWLock:
+    # Readers take only the slot picked by their thread id; writers take
+    # every slot in order, so concurrent readers rarely touch the same lock.
+    def __init__(self, num_slots=None):
+        self._locks = [threading.Lock() for _ in range(num_slots or os.cpu_count() or 1)]
+        self._num_slots = len(self._locks)
+
+    def read(self):
+        return self._locks[threading.get_native_id() % self._num_slots]
+
+    def write(self):
+        return self
+
+    def __enter__(self):
+        for lock in self._locks:
+            lock.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        for lock in reversed(self._locks):
+            lock.release()
+
+# CPython's GIL makes a single dict.get atomic, so readers can skip the
+# shard lock. Free-threaded builds report the GIL as disabled and take the
+# shard's read side instead.
+GIL_ENABLED = getattr(sys, "_is_gil_enabled", lambda: True)()
+
+class Shard:
+    # A shard's lock and dict live on one object, so the hot path fetches
+    # both with a single index instead of two parallel-list lookups.
+    __slots__ = ("lock", "write_lock", "data")
+
+    def __init__(self):
+        if GIL_ENABLED:
+            # Readers never lock on GIL builds, so writers only need one
+            # plain mutex rather than every slot of a ShardedRWLock.
+            self.lock = self.write_lock = threading.Lock()
+        else:
+            self.lock = ShardedRWLock()
+            self.write_lock = self.lock.write()
+        self.data = {}
+
 class HybridDataStructure:
-    def __init__(self, num_shards=4):
+    # Lock-wait timing is off by default (0). A driver that wants it sets
+    # this to N so each thread times every Nth write; lock_wait_time then
+    # scales the samples up to all of that thread's writes.
+    LOCK_SAMPLE_EVERY = 0
+
+    def __init__(self, num_shards=8):
+        # A power-of-two shard count lets keys be routed with a bit mask.
+        if num_shards <= 0 or num_shards & (num_shards - 1):
+            raise ValueError(f"num_shards must be a power of two, got {num_shards}")
         self.num_shards = num_shards
-        self.local_locks = [threading.Lock() for _ in range(num_shards)]
-        self.local_data = [{} for _ in range(num_shards)]
-        self.global_lock = threading.Lock()
-        self.global_counter = 0
-        self.local_reads = 0
-        self.local_writes = 0
-        self.lock_wait_time = 0  
-        self.write_conflicts = 0  
-
-    def _get_shard_index(self, key):
-        return hash(key) % self.num_shards
-    
-    def local_write(self, key, value):
-        shard_index = self._get_shard_index(key)
-        start_time = time.perf_counter()
+        self._mask = num_shards - 1
+        self.shards = [Shard() for _ in range(num_shards)]
+        # Lock-free counters: every thread updates its own ThreadStats and
+        # the totals are summed on read, so hot-path updates never contend.
+        self._tls = threading.local()
+        self._tls_list = []
+        self._registry_lock = threading.Lock()
+
+    def _thread_stats(self):
         try:
-            with self.local_locks[shard_index]:
-                lock_time = time.perf_counter() - start_time
-                self.lock_wait_time += lock_time  
+            return self._tls.stats
+        except AttributeError:
+            stats = ThreadStats()
+            with self._registry_lock:
+                self._tls_list.append(stats)
+            self._tls.stats = stats
+            return stats
 
-                if key in self.local_data[shard_index]:
-                    self.write_conflicts += 1  
+    def _sum_stats(self, field):
+        with self._registry_lock:
+            stats_list = list(self._tls_list)
+        return sum(getattr(stats, field) for stats in stats_list)
 
-                self.local_data[shard_index][key] = self.local_data[shard_index].get(key, 0) + value
-                self.local_writes += 1
+    @property
+    def local_data(self):
+        return [shard.data for shard in self.shards]
+
+    @property
+    def global_counter(self):
+        # Not a linearizable read: cells are summed one at a time, so the
+        # total is only exact once every updating thread has stopped.
+        return self._sum_stats("counter")
+
+    @property
+    def local_reads(self):
+        return self._sum_stats("reads")
+
+    @property
+    def local_writes(self):
+        return self._sum_stats("writes")
+
+    @property
+    def lock_wait_time(self):
+        with self._registry_lock:
+            stats_list = list(self._tls_list)
+        return sum(stats.lock_wait_time * stats.writes / stats.lock_samples
+                   for stats in stats_list if stats.lock_samples)
+
+    @property
+    def write_conflicts(self):
+        return self._sum_stats("write_conflicts")
+
+    def _locked_add(self, key, value, counter_add):
+        # Shared by local_write and hybrid_operation; the counter cell is
+        # thread-private, so it is updated after the shard lock is released.
+        shard = self.shards[hash(key) & self._mask]
+        data = shard.data
+        stats = self._thread_stats()
+        sample_every = self.LOCK_SAMPLE_EVERY
+        if sample_every and stats.writes % sample_every == 0:
+            start_time = time.perf_counter()
+            with shard.write_lock:
+                acquired_time = time.perf_counter()
+                old_value = data.get(key)
+                data[key] = value if old_value is None else old_value + value
+            stats.lock_wait_time += acquired_time - start_time
+            stats.lock_samples += 1
+        else:
+            with shard.write_lock:
+                old_value = data.get(key)
+                data[key] = value if old_value is None else old_value + value
+        stats.counter += counter_add
+        if old_value is not None:
+            stats.write_conflicts += 1
+        stats.writes += 1
+
+    def local_write(self, key, value):
+        try:
+            self._locked_add(key, value, 0)
         except Exception as e:
             print(f"Error in local_write: {e}")
 
     def local_read(self, key):
-        shard_index = self._get_shard_index(key)
+        shard = self.shards[hash(key) & self._mask]
         try:
-            with self.local_locks[shard_index]:
-                self.local_reads += 1
-                return self.local_data[shard_index].get(key, None)
+            self._thread_stats().reads += 1
+            if GIL_ENABLED:
+                return shard.data.get(key, None)
+            with shard.lock.read():
+                return shard.data.get(key, None)
         except Exception as e:
             print(f"Error in local_read: {e}")
 
     def critical_update(self, increment=1):
-        start_time = time.perf_counter()
         try:
-            with self.global_lock:
-                lock_time = time.perf_counter() - start_time
-                self.lock_wait_time += lock_time  
-                self.global_counter += increment
+            self._thread_stats().counter += increment
         except Exception as e:
             print(f"Error in critical_update: {e}")
 
     def hybrid_operation(self, key, value):
-        self.local_write(key, value)
-        self.critical_update(increment=value)
+        # One shard-lock acquisition covers the local write; the global
+        # counter add rides on the same ThreadStats lookup.
+        try:
+            self._locked_add(key, value, value)
+        except Exception as e:
+            print(f"Error in hybrid_operation: {e}")
 
     def print_stats(self):
         print(f"Total Reads: {self.local_reads}, Total Writes: {self.local_writes}")
         print(f"Total Lock Wait Time: {self.lock_wait_time:.6f} sec")
         print(f"Total Write Conflicts: {self.write_conflicts}")
 
+# The 50/50 local read-or-write choice is drawn up front and folded into
+# the task type, so workers dispatch with a single tuple index.
+LOCAL_WRITE, LOCAL_READ, CRITICAL, HYBRID = 0, 1, 2, 3
+TASK_NAMES = ("local write", "local read", "critical", "hybrid")
+
+def generate_tasks(num_operations):
+    # One vectorized draw per column; tolist() hands workers plain ints
+    # rather than NumPy scalars.
+    task_types = np.random.choice([LOCAL_WRITE, LOCAL_READ, CRITICAL, HYBRID], size=num_operations, p=[0.2, 0.2, 0.2, 0.4]).tolist()
+    keys = np.random.randint(1, 11, size=num_operations).tolist()
+    values = np.random.randint(100, 2001, size=num_operations).tolist()
+    return task_types, keys, values
+
 def worker(hybrid_obj, task_queue):
+    handlers = (
+        hybrid_obj.local_write,
+        lambda key, value: hybrid_obj.local_read(key),
+        lambda key, value: hybrid_obj.critical_update(increment=value),
+        hybrid_obj.hybrid_operation,
+    )
     print(f"Thread {threading.current_thread().name} started.")
     while True:
         try:
-            task_type, key, value = task_queue.get(timeout=2)  # אם אין משימה אחרי 2 שניות -> יציאה
-            print(f"Thread {threading.current_thread().name} processing {task_type}")
-            if task_type == "local":
-                if random.random() < 0.5:
-                    hybrid_obj.local_write(key, value)
-                else:
-                    hybrid_obj.local_read(key)
-            elif task_type == "critical":
-                hybrid_obj.critical_update(increment=value)
-            elif task_type == "hybrid":
-                hybrid_obj.hybrid_operation(key, value)
-            task_queue.task_done()
+            task_type, key, value = task_queue.get_nowait()  # התור מולא מראש, ריק -> יציאה
+            print(f"Thread {threading.current_thread().name} processing {TASK_NAMES[task_type]}")
+            handlers[task_type](key, value)
         except queue.Empty:
             print(f"Thread {threading.current_thread().name} exiting - queue empty.")
             return  # יציאה מהלולאה
 
 def run_test(num_threads, num_operations, hybrid_obj):
-    task_queue = queue.Queue()
+    task_queue = queue.SimpleQueue()
     
-    for _ in range(num_operations):
-        task_type = random.choices(["local", "critical", "hybrid"], weights=[0.4, 0.2, 0.4])[0]
-        key = f"resource_{random.randint(1, 10)}"
-        value = random.randint(100, 2000)
-        task_queue.put((task_type, key, value))
+    for task in zip(*generate_tasks(num_operations)):
+        task_queue.put(task)
 
     threads = []
 
@@ -104,11 +230,12 @@ def run_test(num_threads, num_operations, hybrid_obj):
     for t in threads:
         t.join(timeout=5)  # מונע תקיעה
 
+    global_counter = hybrid_obj.global_counter
     total_local_sum = sum(sum(shard.values()) for shard in hybrid_obj.local_data)
-    difference = hybrid_obj.global_counter - total_local_sum
+    difference = global_counter - total_local_sum
 
     print(f"Test with {num_threads} threads and {num_operations} operations completed.")
-    print(f"Final Global Counter = {hybrid_obj.global_counter}")
+    print(f"Final Global Counter = {global_counter}")
     print(f"Total Local Sum = {total_local_sum}")
     print(f"Difference = {difference}")
     hybrid_obj.print_stats()
@@ -120,6 +247,8 @@ if __name__ == "__main__":
     thread_counts = [1, 2, 4, 8, 16, 32, 64]
     num_operations = 1000  
     results = []
+    # Lock wait is one of the plotted metrics, so time every write exactly.
+    HybridDataStructure.LOCK_SAMPLE_EVERY = 1
 
     for count in thread_counts:
         hybrid_ds = HybridDataStructure(num_shards=4)